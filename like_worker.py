@@ -0,0 +1,90 @@
+"""
+Background liking.
+
+Likes are only a processed-state marker, so they do not need to finish before
+the next tweet starts. LikeWorker takes tweet IDs off a queue on its own
+thread, handles them in small batches and retries failures with exponential
+backoff; permanent failures (forbidden, suspended, ...) are dropped.
+"""
+import heapq
+import queue
+import threading
+import time
+
+
+class LikeWorker:
+    def __init__(self, like_fn, batch_size=10, batch_interval=2.0,
+                 max_retries=3, retry_backoff=5.0, permanent_failure_keywords=()):
+        self.like_fn = like_fn
+        self.batch_size = batch_size
+        self.batch_interval = batch_interval
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.permanent_failure_keywords = permanent_failure_keywords
+        self._queue = queue.Queue()
+        self._retries = []  # heap of (due_at, tweet_id, attempt)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="like-worker", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Stop once the queue is empty. Queued likes are still sent; likes waiting
+        in the retry backoff are dropped (and logged) rather than delaying shutdown.
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def submit(self, tweet_id):
+        self._queue.put((str(tweet_id), 0))
+
+    def _next_batch(self):
+        batch = []
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now and len(batch) < self.batch_size:
+            _, tweet_id, attempt = heapq.heappop(self._retries)
+            batch.append((tweet_id, attempt))
+        wait = self.batch_interval
+        if self._retries:
+            wait = min(wait, max(0.0, self._retries[0][0] - now))
+        try:
+            if not batch:
+                batch.append(self._queue.get(timeout=wait))
+            while len(batch) < self.batch_size:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _like(self, tweet_id, attempt):
+        try:
+            self.like_fn(tweet_id)
+        except Exception as e:
+            error_msg = str(e).lower()
+            if any(keyword in error_msg for keyword in self.permanent_failure_keywords):
+                print(f"🚫 Permanent like failure for {tweet_id}: {e}")
+            elif attempt < self.max_retries:
+                delay = self.retry_backoff * (2 ** attempt)
+                print(f"⚠️ Failed to like tweet {tweet_id} (attempt {attempt + 1}), retrying in {delay:.0f}s: {e}")
+                heapq.heappush(self._retries, (time.monotonic() + delay, tweet_id, attempt + 1))
+            else:
+                print(f"⚠️ Giving up on liking tweet {tweet_id} after {attempt + 1} attempts: {e}")
+            return
+        print(f"❤️ Liked tweet {tweet_id}")
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            for tweet_id, attempt in batch:
+                self._like(tweet_id, attempt)
+            if batch and not self._stop.is_set():
+                # Space batches out so likes don't land in a burst after each poll
+                self._stop.wait(self.batch_interval)
+        if self._retries:
+            print(f"⚠️ Like worker stopped with {len(self._retries)} likes awaiting retry; dropping them")
@@ -1,3 +1,4 @@
+import atexit
 import os
 import time
 import tempfile
@@ -7,15 +8,25 @@ import replicate
 import random
 import string
 from datetime import datetime, timedelta
-from collections import defaultdict
 from dotenv import load_dotenv
 
+import profiling
+from like_worker import LikeWorker
+from model_router import ModelRouter, ReplicateProvider, parse_backends
+from rate_limiter import ReplyRateLimiter, format_window
+from tracing import set_outcome, setup_trace_logging, shutdown_trace_logging, span, tweet_trace
+
 load_dotenv()
 
 # --- Config
 BOT_HANDLE           = os.getenv("BOT_HANDLE")
 POLL_SECONDS         = int(os.getenv("POLL_SECONDS", "25"))
 MODEL_REF            = os.getenv("MODEL_REF", "google/nano-banana")
+MODEL_BACKENDS       = os.getenv("MODEL_BACKENDS", "")  # ref=weight,...; empty=MODEL_REF only
+HEDGE_ENABLE         = os.getenv("HEDGE_ENABLE", "1") == "1"
+HEDGE_MAX_RATIO      = float(os.getenv("HEDGE_MAX_RATIO", "0.1"))  # max hedged runs / total runs
+HEDGE_MIN_SAMPLES    = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+MODEL_TIMEOUT        = float(os.getenv("MODEL_TIMEOUT", "300"))
 NANO_PROMPT          = os.getenv("NANO_PROMPT", "")
 SUNGLASSES_URL       = os.getenv("SUNGLASSES_URL")
 BACKGROUND_URL       = os.getenv("BACKGROUND_URL")
@@ -26,18 +37,40 @@ LAST_ID_FILE         = ".last_id"
 # New hardening & authenticity config
 LIKE_MODE            = os.getenv("LIKE_MODE", "all")  # all|probabilistic|none
 LIKE_PROB            = float(os.getenv("LIKE_PROB", "0.7"))  # for probabilistic mode
+LIKE_BATCH_SIZE      = int(os.getenv("LIKE_BATCH_SIZE", "10"))
+LIKE_BATCH_INTERVAL  = float(os.getenv("LIKE_BATCH_INTERVAL", "2"))  # seconds between like batches
+LIKE_MAX_RETRIES     = int(os.getenv("LIKE_MAX_RETRIES", "3"))
+REPLY_RETRY_MAX      = int(os.getenv("REPLY_RETRY_MAX", "3"))  # polls to retry a transiently failed reply
 HUMANIZE_DELAY       = os.getenv("HUMANIZE_DELAY", "1") == "1"
 REPLY_MIN_DELAY      = int(os.getenv("REPLY_MIN_DELAY", "2"))
 REPLY_MAX_DELAY      = int(os.getenv("REPLY_MAX_DELAY", "8"))
 POLL_JITTER_MAX      = int(os.getenv("POLL_JITTER_MAX", "5"))
 PER_USER_MAX         = int(os.getenv("PER_USER_MAX", "0"))  # 0=unlimited
 GLOBAL_MAX           = int(os.getenv("GLOBAL_MAX", "0"))  # 0=unlimited
+PER_USER_WINDOW      = int(os.getenv("PER_USER_WINDOW", "86400"))  # seconds
+GLOBAL_WINDOW        = int(os.getenv("GLOBAL_WINDOW", "86400"))  # seconds
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "10000"))
+RATE_LIMIT_STATE_FILE = os.getenv("RATE_LIMIT_STATE_FILE", "")  # empty=in-memory only
 ALT_TEXT             = os.getenv("ALT_TEXT", "1") == "1"
 VARIANT_ENABLE       = os.getenv("VARIANT_ENABLE", "0") == "1"
 PROMPT_UNIQUIFIER    = os.getenv("PROMPT_UNIQUIFIER", "1") == "1"
 PROCESSED_STATE_FILE = os.getenv("PROCESSED_STATE_FILE", ".processed_ids")
 PROCESSED_STATE_CAP  = int(os.getenv("PROCESSED_STATE_CAP", "10000"))
 IGNORE_HISTORY       = os.getenv("IGNORE_HISTORY", "0") == "1"
+COALESCE_GENERATIONS = os.getenv("COALESCE_GENERATIONS", "1") == "1"
+
+# Observability
+TRACE_ENABLE         = os.getenv("TRACE_ENABLE", "1") == "1"
+TRACE_FILE           = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_MAX_BYTES      = int(os.getenv("TRACE_MAX_BYTES", str(5 * 1024 * 1024)))
+TRACE_BACKUP_COUNT   = int(os.getenv("TRACE_BACKUP_COUNT", "3"))
+PROFILE_DIR          = os.getenv("PROFILE_DIR", "")  # empty=system temp dir
+
+# Error substrings that mean retrying (or trying another method) won't help
+PERMANENT_FAILURE_KEYWORDS = [
+    'forbidden', 'not authorized', 'read-only', 'read only',
+    'permission', 'suspended', 'blocked', 'unauthorized'
+]
 
 # Reply text variants for diversification
 REPLY_VARIANTS = [
@@ -74,6 +107,16 @@ print("Tweepy version:", tweepy.__version__)
 # Replicate
 os.environ["REPLICATE_API_TOKEN"] = os.getenv("REPLICATE_API_TOKEN")
 
+# Model execution across one or more backends, with hedging on slow runs
+model_router = ModelRouter(
+    parse_backends(MODEL_BACKENDS, MODEL_REF),
+    ReplicateProvider(replicate),
+    hedge_enable=HEDGE_ENABLE,
+    hedge_min_samples=HEDGE_MIN_SAMPLES,
+    hedge_max_ratio=HEDGE_MAX_RATIO,
+    timeout=MODEL_TIMEOUT,
+)
+
 # Global state for likes-as-state and user caching
 liked_tweet_ids = set()
 user_profile_cache = {}  # username -> profile_image_url
@@ -82,10 +125,24 @@ bot_user_id = None
 # Local processed state (independent of likes)
 processed_tweet_ids = set()
 
-# Rate limiting state (resets daily)
-user_reply_counts = defaultdict(int)  # username -> count
-global_reply_count = 0
-rate_limit_reset_date = datetime.now().date()
+# Rate limiting state (sliding windows per user and global)
+rate_limiter = ReplyRateLimiter(
+    per_user_max=PER_USER_MAX,
+    per_user_window=PER_USER_WINDOW,
+    global_max=GLOBAL_MAX,
+    global_window=GLOBAL_WINDOW,
+    max_users=RATE_LIMIT_MAX_USERS,
+    state_file=RATE_LIMIT_STATE_FILE,
+)
+
+# Working reply posting method, detected on first reply: (name, fn)
+reply_method = None
+
+# Replies deferred after a transient error: [tweet_id, media_id, handle, author_username, attempts]
+pending_replies = []
+
+# Per-batch generation reuse: (person_url, sunglasses_url, background_url, prompt, model) -> PNG bytes
+generated_images = {}
 
 # Session token for prompt uniquification
 session_token = ''.join(random.choices(string.ascii_lowercase + string.digits, k=8))
@@ -95,6 +152,10 @@ start_time = datetime.utcnow()
 
 # Startup logging
 print(f"🚀 Bot Configuration:")
+print(f"   MODEL_BACKENDS: {', '.join(f'{b.ref}={b.weight:g}' for b in model_router.backends)}")
+print(f"   HEDGE_ENABLE: {HEDGE_ENABLE}" + ("" if model_router.hedge_enable or not HEDGE_ENABLE else " (inactive: single backend)"))
+if model_router.hedge_enable:
+    print(f"   HEDGE_MAX_RATIO: {HEDGE_MAX_RATIO}")
 print(f"   LIKE_MODE: {LIKE_MODE}")
 if LIKE_MODE == "probabilistic":
     print(f"   LIKE_PROB: {LIKE_PROB}")
@@ -103,9 +164,11 @@ if HUMANIZE_DELAY:
     print(f"   REPLY_DELAY: {REPLY_MIN_DELAY}-{REPLY_MAX_DELAY}s")
 print(f"   POLL_JITTER_MAX: {POLL_JITTER_MAX}s")
 if PER_USER_MAX > 0:
-    print(f"   PER_USER_MAX: {PER_USER_MAX}/day")
+    print(f"   PER_USER_MAX: {PER_USER_MAX}/{format_window(PER_USER_WINDOW)}")
 if GLOBAL_MAX > 0:
-    print(f"   GLOBAL_MAX: {GLOBAL_MAX}/day")
+    print(f"   GLOBAL_MAX: {GLOBAL_MAX}/{format_window(GLOBAL_WINDOW)}")
+if RATE_LIMIT_STATE_FILE:
+    print(f"   RATE_LIMIT_STATE_FILE: {RATE_LIMIT_STATE_FILE}")
 print(f"   ALT_TEXT: {ALT_TEXT}")
 print(f"   VARIANT_ENABLE: {VARIANT_ENABLE}")
 print(f"   PROMPT_UNIQUIFIER: {PROMPT_UNIQUIFIER}")
@@ -114,6 +177,8 @@ if PROMPT_UNIQUIFIER:
 print(f"   PROCESSED_STATE_FILE: {PROCESSED_STATE_FILE}")
 print(f"   PROCESSED_STATE_CAP: {PROCESSED_STATE_CAP}")
 print(f"   IGNORE_HISTORY: {IGNORE_HISTORY}")
+print(f"   COALESCE_GENERATIONS: {COALESCE_GENERATIONS}")
+print(f"   TRACE_ENABLE: {TRACE_ENABLE}")
 
 def load_last_id():
     try:
@@ -154,37 +219,14 @@ def save_processed_id(tweet_id):
         print(f"⚠️ Failed to save processed ID {tweet_id}: {e}")
 
 
-def reset_rate_limits_if_needed():
-    """Reset rate limit counters if it's a new day."""
-    global rate_limit_reset_date, user_reply_counts, global_reply_count
-    today = datetime.now().date()
-    if today > rate_limit_reset_date:
-        print(f"📅 New day detected, resetting rate limits")
-        user_reply_counts.clear()
-        global_reply_count = 0
-        rate_limit_reset_date = today
-
-
 def check_rate_limits(username):
     """Check if rate limits allow processing. Returns (can_process, reason)."""
-    reset_rate_limits_if_needed()
-    
-    # Check global cap
-    if GLOBAL_MAX > 0 and global_reply_count >= GLOBAL_MAX:
-        return False, f"global daily limit ({GLOBAL_MAX}) reached"
-    
-    # Check per-user cap
-    if PER_USER_MAX > 0 and user_reply_counts[username] >= PER_USER_MAX:
-        return False, f"per-user daily limit ({PER_USER_MAX}) for @{username} reached"
-    
-    return True, ""
+    return rate_limiter.check(username)
 
 
 def increment_rate_limits(username):
-    """Increment rate limit counters after successful reply."""
-    global global_reply_count
-    user_reply_counts[username] += 1
-    global_reply_count += 1
+    """Count a successful reply against the rate limits."""
+    rate_limiter.record(username)
 
 
 def fetch_mentions(since_id=None):
@@ -283,7 +325,8 @@ def resolve_user_profile_image(username):
         return user_profile_cache[username]
     
     try:
-        user = client.get_user(username=username, user_fields="profile_image_url")
+        with span("resolve_user_profile_image", username=username):
+            user = client.get_user(username=username, user_fields="profile_image_url")
         if user.data:
             profile_url = getattr(user.data, "profile_image_url", None)
             if profile_url:
@@ -422,8 +465,22 @@ def preload_liked_tweets():
         print(f"⚠️ Failed to preload liked tweets: {e}")
 
 
+def _like_tweet(tweet_id):
+    client.like(tweet_id, user_auth=True)
+    liked_tweet_ids.add(str(tweet_id))
+
+
+like_worker = LikeWorker(
+    _like_tweet,
+    batch_size=LIKE_BATCH_SIZE,
+    batch_interval=LIKE_BATCH_INTERVAL,
+    max_retries=LIKE_MAX_RETRIES,
+    permanent_failure_keywords=PERMANENT_FAILURE_KEYWORDS,
+)
+
+
 def mark_tweet_as_processed(tweet_id):
-    """Like the tweet to mark it as processed (based on LIKE_MODE)."""
+    """Queue a like to mark the tweet as processed (based on LIKE_MODE)."""
     should_like = False
     
     if LIKE_MODE == "all":
@@ -433,12 +490,7 @@ def mark_tweet_as_processed(tweet_id):
     # LIKE_MODE == "none" means should_like stays False
     
     if should_like:
-        try:
-            client.like(tweet_id, user_auth=True)
-            liked_tweet_ids.add(str(tweet_id))
-            print(f"❤️ Liked tweet {tweet_id}")
-        except Exception as e:
-            print(f"⚠️ Failed to like tweet {tweet_id}: {e}")
+        like_worker.submit(tweet_id)
     else:
         print(f"💭 Not liking tweet {tweet_id} (LIKE_MODE={LIKE_MODE})")
 
@@ -451,25 +503,25 @@ def write_bytes_tmp(content: bytes, suffix=".png") -> str:
 
 
 def download_tmp(url: str, suffix=".png") -> str:
-    r = requests.get(url, timeout=60)
-    r.raise_for_status()
-    return write_bytes_tmp(r.content, suffix)
+    with span("download_tmp"):
+        r = requests.get(url, timeout=60)
+        r.raise_for_status()
+        return write_bytes_tmp(r.content, suffix)
 
 
 def run_nano_banana(person_url: str, sunglasses_url: str, background_url: str, prompt: str) -> str:
-    """Calls google/nano-banana with three inputs and returns local PNG path."""
+    """Calls the model router with three inputs and returns local PNG path."""
     # Add prompt uniquification if enabled
     if PROMPT_UNIQUIFIER:
         prompt = f"{prompt}\n#session:{session_token}"
     
-    out = replicate.run(
-        MODEL_REF,
-        input={
+    with span("replicate_run") as run_attrs:
+        out, run_info = model_router.run({
             "prompt": prompt,
             "image_input": [person_url, sunglasses_url, background_url],
             "output_format": "png",
-        },
-    )
+        })
+        run_attrs.update(run_info)
     # Try file-like first
     try:
         data = out.read()
@@ -489,6 +541,34 @@ def run_nano_banana(person_url: str, sunglasses_url: str, background_url: str, p
         raise RuntimeError(f"Unexpected Replicate output type: {type(out)}")
 
 
+def run_nano_banana_coalesced(person_url: str, sunglasses_url: str, background_url: str, prompt: str) -> str:
+    """
+    Reuse generations within the current poll batch.
+    Tweets are handled one at a time, so the first tweet for a given
+    (person image, prompt, model) key runs the prediction and later tweets in
+    the same batch reuse its PNG bytes. Every caller gets its own temp file.
+    """
+    if not COALESCE_GENERATIONS:
+        return run_nano_banana(person_url, sunglasses_url, background_url, prompt)
+
+    key = (person_url, sunglasses_url, background_url, prompt, MODEL_BACKENDS or MODEL_REF)
+    data = generated_images.get(key)
+    if data is not None:
+        print(f"🔁 Reusing generation for {person_url}")
+        return write_bytes_tmp(data, ".png")
+
+    # Failed runs raise before anything is stored, so the next tweet retries
+    out_path = run_nano_banana(person_url, sunglasses_url, background_url, prompt)
+    with open(out_path, "rb") as f:
+        generated_images[key] = f.read()
+    return out_path
+
+
+def clear_generated_images():
+    """Forget this batch's generations once the poll batch is done."""
+    generated_images.clear()
+
+
 def apply_image_variation(image_path: str) -> str:
     """Apply subtle variation to image if VARIANT_ENABLE and Pillow available."""
     if not VARIANT_ENABLE:
@@ -531,14 +611,16 @@ def apply_image_variation(image_path: str) -> str:
 
 def upload_media(path: str) -> str:
     """Upload media and optionally add alt text."""
-    media = api_v1.media_upload(filename=path)
+    with span("media_upload"):
+        media = api_v1.media_upload(filename=path)
     media_id = str(media.media_id)
     
     # Add alt text if enabled
     if ALT_TEXT:
         try:
             alt_text = "Profile image edited with stylish sunglasses and vibrant gradient background"
-            api_v1.create_media_metadata(media_id, alt_text)
+            with span("create_media_metadata"):
+                api_v1.create_media_metadata(media_id, alt_text)
             print(f"📝 Added alt text to media {media_id}")
         except Exception as e:
             print(f"⚠️ Failed to add alt text: {e}")
@@ -546,73 +628,112 @@ def upload_media(path: str) -> str:
     return media_id
 
 
+def _reply_create_tweet_flat(text, in_reply_to_tweet_id, media_id):
+    """Older v2 style: media_ids=[...] (no 'media' dict)."""
+    client.create_tweet(
+        text=text,
+        in_reply_to_tweet_id=in_reply_to_tweet_id,
+        media_ids=[media_id],
+    )
+
+
+def _reply_create_tweet_nested(text, in_reply_to_tweet_id, media_id):
+    """Newer style (if available): reply={}, media={}."""
+    client.create_tweet(
+        text=text,
+        reply={"in_reply_to_tweet_id": in_reply_to_tweet_id},
+        media={"media_ids": [media_id]},
+    )
+
+
+def _reply_update_status_v1(text, in_reply_to_tweet_id, media_id):
+    """v1.1 fallback via api_v1.update_status."""
+    api_v1.update_status(
+        status=text,
+        in_reply_to_status_id=in_reply_to_tweet_id,
+        auto_populate_reply_metadata=True,
+        media_ids=[media_id],
+    )
+
+
+REPLY_METHODS = [
+    ("create_tweet_flat", _reply_create_tweet_flat),
+    ("create_tweet_nested", _reply_create_tweet_nested),
+    ("update_status_v1", _reply_update_status_v1),
+]
+
+
+def is_permanent_failure(error):
+    error_msg = str(error).lower()
+    return any(keyword in error_msg for keyword in PERMANENT_FAILURE_KEYWORDS)
+
+
 def reply_with_media(in_reply_to_tweet_id: str, media_id: str, username: str):
     """
-    Try multiple Tweepy signatures for compatibility.
-    Returns True on success, False on permanent failure.
-    
-    1. Older v2 style: media_ids=[...] (no 'media' dict)
-    2. Newer style (if available): reply={}, media={}
-    3. v1.1 fallback via api_v1.update_status
+    Post the reply using the cached working method, probing REPLY_METHODS in
+    order only when nothing is cached yet or the cached one raises TypeError
+    (signature mismatch). Returns True on success, False on permanent failure,
+    and None on a transient error (the caller may retry later).
     """
+    global reply_method
     # Use random reply variant
     text = random.choice(REPLY_VARIANTS).format(username=username)
-    
-    # Permanent failure keywords
-    permanent_failure_keywords = [
-        'forbidden', 'not authorized', 'read-only', 'read only',
-        'permission', 'suspended', 'blocked', 'unauthorized'
-    ]
 
-    # Attempt 1: flattened media_ids + in_reply_to_tweet_id
-    try:
-        client.create_tweet(
-            text=text,
-            in_reply_to_tweet_id=in_reply_to_tweet_id,
-            media_ids=[media_id],
-        )
-        return True
-    except TypeError:
-        pass
-    except Exception as e:
-        error_msg = str(e).lower()
-        if any(keyword in error_msg for keyword in permanent_failure_keywords):
-            print(f"🚫 Permanent posting failure (attempt 1): {e}")
-            return False
+    if reply_method is not None:
+        name, send = reply_method
+        try:
+            with span("reply_attempt", method=name):
+                send(text, in_reply_to_tweet_id, media_id)
+            return True
+        except TypeError as e:
+            print(f"🔌 Reply method {name} no longer fits ({e}), re-probing")
+            reply_method = None
+        except Exception as e:
+            if is_permanent_failure(e):
+                print(f"🚫 Permanent posting failure ({name}): {e}")
+                return False
+            print(f"⚠️ Transient reply failure via {name}: {e}")
+            return None
 
-    # Attempt 2: nested dict style
-    try:
-        client.create_tweet(
-            text=text,
-            reply={"in_reply_to_tweet_id": in_reply_to_tweet_id},
-            media={"media_ids": [media_id]},
-        )
+    # Only a signature mismatch (TypeError) moves on to the next shape; any other
+    # error says nothing about which shape works, so stop without caching
+    last_error = None
+    for name, send in REPLY_METHODS:
+        try:
+            with span("reply_attempt", method=name):
+                send(text, in_reply_to_tweet_id, media_id)
+        except TypeError as e:
+            last_error = e
+            continue
+        except Exception as e:
+            if is_permanent_failure(e):
+                print(f"🚫 Permanent posting failure ({name}): {e}")
+                return False
+            print(f"⚠️ Transient reply failure via {name}: {e}")
+            return None
+        reply_method = (name, send)
+        print(f"🔌 Using reply method {name}")
         return True
-    except TypeError:
-        pass
-    except Exception as e:
-        error_msg = str(e).lower()
-        if any(keyword in error_msg for keyword in permanent_failure_keywords):
-            print(f"🚫 Permanent posting failure (attempt 2): {e}")
-            return False
 
-    # Attempt 3: v1.1 fallback
-    try:
-        api_v1.update_status(
-            status=text,
-            in_reply_to_status_id=in_reply_to_tweet_id,
-            auto_populate_reply_metadata=True,
-            media_ids=[media_id],
-        )
-        return True
-    except Exception as e:
-        error_msg = str(e).lower()
-        if any(keyword in error_msg for keyword in permanent_failure_keywords):
-            print(f"🚫 Permanent posting failure (v1.1 fallback): {e}")
-            return False
+    print(f"⚠️ No reply method fits this Tweepy version: {last_error}")
+    return False
+
+
+def retry_pending_replies():
+    """Retry replies that hit a transient error, reusing their uploaded media."""
+    global pending_replies
+    still_pending = []
+    for tweet_id, media_id, handle, author_username, attempts in pending_replies:
+        result = reply_with_media(tweet_id, media_id, handle)
+        if result:
+            print(f"✅ Replied to {tweet_id} (@{handle}) on retry {attempts}")
+            mark_tweet_as_processed(tweet_id)
+            increment_rate_limits(author_username)
+        elif result is None and attempts < REPLY_RETRY_MAX:
+            still_pending.append([tweet_id, media_id, handle, author_username, attempts + 1])
         else:
-            print(f"⚠️ Failed to send reply via all methods: {e}")
-            return False
+            print(f"📝 Giving up on replying to {tweet_id} after {attempts + 1} attempts")
+    pending_replies = still_pending
 
 
 def process_tweet(tweet, usernames, media_map):
@@ -623,6 +744,7 @@ def process_tweet(tweet, usernames, media_map):
     if author_username.lower() == BOT_HANDLE.lower():
         print(f"🔄 Skipping {tweet.id}: tweet authored by bot (@{author_username}) - avoiding self-recursion")
         save_processed_id(tweet_id_str)  # Mark as processed to avoid re-queuing
+        set_outcome("skipped", reason="self")
         return
     
     # Check 0: Time gate for defensive skipping when IGNORE_HISTORY is enabled
@@ -631,17 +753,20 @@ def process_tweet(tweet, usernames, media_map):
         if tweet_created_at and tweet_created_at < start_time:
             print(f"🕰️ Skipping {tweet.id}: tweet created before bot startup (history gate)")
             save_processed_id(tweet_id_str)
+            set_outcome("skipped", reason="history")
             return
     
     # Check 1: Local processed state (primary dedupe)
     if tweet_id_str in processed_tweet_ids:
         print(f"⏩ Skipping {tweet.id}: already in local processed state")
+        set_outcome("skipped", reason="processed")
         return
     
     # Check 2: Liked set (for backward compatibility with SKIP_IF_LIKED)
     if SKIP_IF_LIKED and tweet_id_str in liked_tweet_ids:
         print(f"⏩ Skipping {tweet.id}: already processed (liked)")
         save_processed_id(tweet_id_str)  # Sync to local state
+        set_outcome("skipped", reason="liked")
         return
     
     # Check 3: Rate limits
@@ -649,31 +774,37 @@ def process_tweet(tweet, usernames, media_map):
     if not can_process:
         print(f"🚫 Skipping {tweet.id}: {reason}")
         save_processed_id(tweet_id_str)  # Mark as processed to prevent re-queuing churn
+        set_outcome("skipped", reason="rate_limited")
         return
     
     # Determine image source
-    person_url = determine_person_image_url(tweet, usernames, media_map)
+    with span("determine_person_image_url"):
+        person_url = determine_person_image_url(tweet, usernames, media_map)
     if not person_url:
         has_attachments = bool(getattr(tweet, "attachments", None))
         print(f"⏭️  {tweet.id}: no usable image source (attachments={has_attachments}); skipping.")
         save_processed_id(tweet_id_str)  # Mark as processed
+        set_outcome("skipped", reason="no_image")
         return
     if not SUNGLASSES_URL or not BACKGROUND_URL:
         print("❗ Set SUNGLASSES_URL and BACKGROUND_URL in your environment")
+        set_outcome("skipped", reason="config")
         return
 
     # Humanization: random delay before processing
     if HUMANIZE_DELAY:
         delay = random.uniform(REPLY_MIN_DELAY, REPLY_MAX_DELAY)
         print(f"⏱️ Waiting {delay:.1f}s before replying to {tweet.id}")
-        time.sleep(delay)
+        with span("humanize_delay"):
+            time.sleep(delay)
 
     # Generate image
-    out_path = run_nano_banana(person_url, SUNGLASSES_URL, BACKGROUND_URL, NANO_PROMPT)
+    out_path = run_nano_banana_coalesced(person_url, SUNGLASSES_URL, BACKGROUND_URL, NANO_PROMPT)
     variant_path = None
     try:
         # Apply variation if enabled
-        final_path = apply_image_variation(out_path)
+        with span("apply_image_variation"):
+            final_path = apply_image_variation(out_path)
         if final_path != out_path:
             variant_path = final_path
         
@@ -687,11 +818,18 @@ def process_tweet(tweet, usernames, media_map):
         
         if reply_success:
             print(f"✅ Replied to {tweet.id} (@{handle})")
+            set_outcome("replied")
             # Only like and increment rate limits on successful post
             mark_tweet_as_processed(tweet.id)
             increment_rate_limits(author_username)
+        elif reply_success is None:
+            # Media is already uploaded; retry just the reply on the next poll
+            pending_replies.append([tweet_id_str, media_id, handle, author_username, 1])
+            print(f"🔁 Reply to {tweet.id} deferred to next poll after a transient error")
+            set_outcome("reply_deferred")
         else:
             print(f"📝 Marked {tweet.id} as processed (no post) to prevent reprocessing")
+            set_outcome("reply_failed")
         
     finally:
         # Cleanup temp files
@@ -704,11 +842,19 @@ def process_tweet(tweet, usernames, media_map):
 
 
 def main():
+    if TRACE_ENABLE:
+        setup_trace_logging(TRACE_FILE, TRACE_MAX_BYTES, TRACE_BACKUP_COUNT)
+        atexit.register(shutdown_trace_logging)
+    profiling.configure(PROFILE_DIR)
+
     # Load local processed state
     load_processed_ids()
+    rate_limiter.load()
     
     # Preload liked tweets (for backward compat with SKIP_IF_LIKED)
     preload_liked_tweets()
+    like_worker.start()
+    atexit.register(like_worker.stop, 10)
     
     # Initialize cursor if IGNORE_HISTORY is enabled
     if IGNORE_HISTORY:
@@ -721,6 +867,7 @@ def main():
     print(f"🚀 bot up. last_id={last_id}")
     while True:
         try:
+            retry_pending_replies()
             resp = fetch_mentions(last_id)
             if resp.data:
                 tweets = sorted(resp.data, key=lambda t: int(t.id))
@@ -729,7 +876,8 @@ def main():
 
                 for t in tweets:
                     try:
-                        process_tweet(t, usernames, media_map)
+                        with tweet_trace(t.id), profiling.profile_tweet():
+                            process_tweet(t, usernames, media_map)
                     except Exception as e:
                         # Catch errors in individual tweet processing to prevent blocking last_id update
                         tweet_id = getattr(t, 'id', 'unknown')
@@ -737,8 +885,10 @@ def main():
                         # Mark as processed to prevent retry loop
                         save_processed_id(str(tweet_id))
 
+                clear_generated_images()
                 last_id = tweets[-1].id
                 save_last_id(last_id)
+                rate_limiter.save()
         except Exception as e:
             print("⚠️ error:", e)
         
@@ -0,0 +1,278 @@
+"""
+Multi-backend model execution with hedged requests.
+
+ModelRouter spreads predictions across several backends (model refs or
+owner/name:version refs), each with a static weight. New work is routed by
+weight scaled down by each backend's observed latency and error rate. If the
+first prediction is still running past the rolling p95 latency of its backend,
+a duplicate is started on another backend (within a budget of HEDGE_MAX_RATIO
+of all runs, and only when more than one backend is configured); the first to
+succeed wins and the other is cancelled so it stops billing. A prediction
+that fails, or fails to start, is retried once on another backend. Errors
+while polling a prediction's status are treated as transient; after
+max_poll_errors in a row the prediction is cancelled and dropped without
+counting against its backend.
+
+Providers are pluggable: anything with start(ref, input) returning a handle
+with poll() -> (done, output, error) and cancel() works; tests/test_model_router.py
+exercises the routing logic against a local fake.
+"""
+import random
+import threading
+import time
+from collections import deque
+
+
+class ReplicateProvider:
+    """Starts predictions on Replicate without blocking on them."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def start(self, ref, input):
+        if ":" in ref:
+            prediction = self.client.predictions.create(version=ref.split(":", 1)[1], input=input)
+        else:
+            prediction = self.client.models.predictions.create(model=ref, input=input)
+        return _ReplicateHandle(prediction)
+
+
+class _ReplicateHandle:
+    def __init__(self, prediction):
+        self.prediction = prediction
+
+    def poll(self):
+        self.prediction.reload()
+        status = self.prediction.status
+        if status == "succeeded":
+            return True, self.prediction.output, None
+        if status in ("failed", "canceled"):
+            return True, None, RuntimeError(self.prediction.error or f"prediction {status}")
+        return False, None, None
+
+    def cancel(self):
+        try:
+            self.prediction.cancel()
+        except Exception as e:
+            print(f"⚠️ Failed to cancel prediction {self.prediction.id}: {e}")
+
+
+class Backend:
+    """A model ref plus its rolling latency/error statistics."""
+
+    def __init__(self, ref, weight=1.0, window=100, alpha=0.2):
+        self.ref = ref
+        self.weight = weight
+        self.alpha = alpha
+        self.latencies = deque(maxlen=window)
+        self.latency_ewma = None
+        self.error_rate = 0.0
+
+    def record_latency(self, seconds, censored=False):
+        # Censored samples (cancelled losers) only steer routing; keeping them
+        # out of the quantile window stops them from inflating the hedge delay
+        if not censored:
+            self.latencies.append(seconds)
+        if self.latency_ewma is None:
+            self.latency_ewma = seconds
+        else:
+            self.latency_ewma += self.alpha * (seconds - self.latency_ewma)
+
+    def record_result(self, ok):
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+
+    def quantile(self, q):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def snapshot(self):
+        return {
+            "ref": self.ref,
+            "weight": self.weight,
+            "samples": len(self.latencies),
+            "latency_ewma": self.latency_ewma,
+            "p95": self.quantile(0.95),
+            "error_rate": round(self.error_rate, 3),
+        }
+
+
+def parse_backends(spec, default_ref):
+    """Parse "ref=weight,ref2=weight" (weight optional) into Backends."""
+    backends = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        ref, _, weight = item.partition("=")
+        ref = ref.strip()
+        try:
+            value = float(weight) if weight.strip() else 1.0
+        except ValueError:
+            raise ValueError(f"MODEL_BACKENDS: weight for {ref} must be a number, got {weight!r}")
+        if not value > 0:
+            raise ValueError(f"MODEL_BACKENDS: weight for {ref} must be > 0, got {weight!r}")
+        backends.append(Backend(ref, value))
+    return backends or [Backend(default_ref)]
+
+
+class ModelRouter:
+    def __init__(self, backends, provider, hedge_enable=True, hedge_quantile=0.95,
+                 hedge_min_samples=20, hedge_max_ratio=0.1, min_health=0.02,
+                 poll_interval=0.5, timeout=300.0, max_poll_errors=5):
+        self.backends = backends
+        self.provider = provider
+        # Hedging onto the same single backend would just duplicate spend
+        self.hedge_enable = hedge_enable and len(backends) > 1
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_ratio = hedge_max_ratio
+        self.min_health = min_health
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.max_poll_errors = max_poll_errors
+        self.runs = 0
+        self.hedges = 0
+        self.retries = 0
+        self._lock = threading.Lock()
+
+    def _score(self, backend, default_latency):
+        latency = backend.latency_ewma or default_latency
+        # A backend that keeps failing keeps a small share so it can recover
+        health = max(self.min_health, 1.0 - backend.error_rate)
+        return backend.weight * health / latency
+
+    def pick(self, exclude=None):
+        """Weighted-random choice favouring fast, healthy backends."""
+        with self._lock:
+            candidates = [b for b in self.backends if b is not exclude] or self.backends
+            known = [b.latency_ewma for b in candidates if b.latency_ewma]
+            # Unmeasured backends are scored at the fastest known latency so they get explored
+            default_latency = min(known) if known else 1.0
+            scores = [self._score(b, default_latency) for b in candidates]
+            return random.choices(candidates, weights=scores, k=1)[0]
+
+    def _hedge_delay(self, backend):
+        if not self.hedge_enable:
+            return None
+        with self._lock:
+            if len(backend.latencies) < self.hedge_min_samples:
+                return None
+            return backend.quantile(self.hedge_quantile)
+
+    def _hedge_allowed(self):
+        with self._lock:
+            if self.hedges + 1 > self.hedge_max_ratio * self.runs:
+                return False
+            self.hedges += 1
+            return True
+
+    def _record(self, backend, seconds, ok, censored=False):
+        with self._lock:
+            if not censored:
+                backend.record_result(ok)
+            if seconds is not None:
+                backend.record_latency(seconds, censored)
+
+    def _start(self, backend, input):
+        """Start a prediction; a failure to start counts as a backend error."""
+        try:
+            return self.provider.start(backend.ref, input)
+        except Exception as e:
+            self._record(backend, None, False)
+            print(f"⚠️ Model backend {backend.ref} failed to start: {e}")
+            raise
+
+    def run(self, input):
+        """
+        Run one prediction, hedging if it is slow and retrying once on another
+        backend if it fails. Returns (output, info) where info holds the
+        winning backend ref and whether the run was hedged or retried.
+        """
+        with self._lock:
+            self.runs += 1
+        primary = self.pick()
+        hedge_after = self._hedge_delay(primary)
+        started = time.monotonic()
+        active = []
+        backup_started = False
+        info = {"backend": None, "hedged": False, "retried": False}
+        last_error = None
+        try:
+            active.append([primary, self._start(primary, input), started, 0])
+        except Exception as e:
+            last_error = e
+
+        while True:
+            for entry in list(active):
+                backend, handle, t0, poll_errors = entry
+                try:
+                    done, output, error = handle.poll()
+                    entry[3] = 0
+                except Exception as e:
+                    # A failed status check says nothing about the prediction itself
+                    entry[3] = poll_errors + 1
+                    if entry[3] < self.max_poll_errors:
+                        print(f"⚠️ Polling {backend.ref} failed ({entry[3]}/{self.max_poll_errors}): {e}")
+                        continue
+                    print(f"⚠️ Giving up on polling {backend.ref}, cancelling: {e}")
+                    handle.cancel()
+                    active.remove(entry)
+                    last_error = e
+                    continue
+                if not done:
+                    continue
+                active.remove(entry)
+                if error is None:
+                    self._record(backend, time.monotonic() - t0, True)
+                    for loser, loser_handle, loser_t0, _ in active:
+                        loser_handle.cancel()
+                        # The loser took at least this long
+                        self._record(loser, time.monotonic() - loser_t0, True, censored=True)
+                    if info["hedged"]:
+                        print(f"⚡ Hedged run won by {backend.ref}")
+                    info["backend"] = backend.ref
+                    return output, info
+                self._record(backend, None, False)
+                last_error = error
+                print(f"⚠️ Model backend {backend.ref} failed: {error}")
+
+            elapsed = time.monotonic() - started
+            if not backup_started:
+                if not active:
+                    backup_started = info["retried"] = True
+                    with self._lock:
+                        self.retries += 1
+                    backup = self.pick(exclude=primary)
+                    print(f"🔁 Retrying on {backup.ref}")
+                elif hedge_after is not None and elapsed >= hedge_after and self._hedge_allowed():
+                    backup_started = info["hedged"] = True
+                    backup = self.pick(exclude=primary)
+                    print(f"⚡ {primary.ref} exceeded p95 ({hedge_after:.1f}s), hedging on {backup.ref}")
+                else:
+                    backup = None
+                if backup is not None:
+                    try:
+                        active.append([backup, self._start(backup, input), time.monotonic(), 0])
+                    except Exception as e:
+                        last_error = e
+                    continue
+
+            if not active:
+                raise RuntimeError(f"All model backends failed: {last_error}")
+            if elapsed >= self.timeout:
+                for backend, handle, _, _ in active:
+                    handle.cancel()
+                    self._record(backend, None, False)
+                raise RuntimeError(f"Model run timed out after {self.timeout:.0f}s")
+            time.sleep(self.poll_interval)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "runs": self.runs,
+                "hedges": self.hedges,
+                "retries": self.retries,
+                "backends": [b.snapshot() for b in self.backends],
+            }
@@ -0,0 +1,169 @@
+"""
+On-demand cProfile / tracemalloc captures for the live bot.
+
+cProfile only sees the thread that enables it, so the admin endpoints never
+profile directly: they arm a capture and the bot loop wraps each tweet in
+profile_tweet(), which turns the profiler on in the bot thread for a sampled
+fraction of tweets. tracemalloc is process-wide and is toggled directly.
+"""
+import cProfile
+import os
+import random
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+output_dir = tempfile.gettempdir()
+
+_lock = threading.Lock()
+_cpu = {
+    "profiler": None,
+    "armed": False,
+    "active": False,      # profiler currently enabled in the bot thread
+    "sample_rate": 1.0,
+    "started_at": None,
+    "tweets_profiled": 0,
+    "result_path": None,
+}
+_memory = {
+    "started_at": None,
+    "result_path": None,
+}
+
+
+def configure(directory):
+    """Set where capture results are written."""
+    global output_dir
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+        output_dir = directory
+
+
+def _result_path(kind, ext):
+    # Nanosecond timestamps keep two captures in the same second from colliding
+    return os.path.join(output_dir, f"pfp_bot_{kind}_{time.time_ns()}.{ext}")
+
+
+def _dump_cpu_locked():
+    path = _result_path("cpu", "prof")
+    _cpu["profiler"].dump_stats(path)
+    _cpu["profiler"] = None
+    _cpu["result_path"] = path
+    print(f"🔬 CPU profile written to {path} ({_cpu['tweets_profiled']} tweets)")
+
+
+def start_cpu_capture(sample_rate=1.0):
+    """
+    Arm cProfile for a fraction of subsequent tweets. Refused while a capture
+    is armed or a stopped one is still waiting for its sampled tweet to finish.
+    """
+    with _lock:
+        if _cpu["armed"] or _cpu["active"]:
+            return False
+        _cpu.update(
+            profiler=cProfile.Profile(),
+            armed=True,
+            sample_rate=max(0.0, min(1.0, sample_rate)),
+            started_at=time.time(),
+            tweets_profiled=0,
+            result_path=None,
+        )
+    print(f"🔬 CPU profiling armed (sample_rate={sample_rate})")
+    return True
+
+
+def stop_cpu_capture():
+    """
+    Disarm cProfile. Returns the stats path, or None if a sampled tweet is
+    still running (the bot thread writes the file when that tweet finishes).
+    """
+    with _lock:
+        if not _cpu["armed"]:
+            return _cpu["result_path"]
+        _cpu["armed"] = False
+        if not _cpu["active"]:
+            _dump_cpu_locked()
+        return _cpu["result_path"]
+
+
+@contextmanager
+def profile_tweet():
+    """Profile the enclosed block in the calling thread if a capture samples it."""
+    with _lock:
+        profiler = _cpu["profiler"]
+        sampled = _cpu["armed"] and random.random() < _cpu["sample_rate"]
+        if sampled:
+            _cpu["active"] = True
+    if not sampled:
+        yield
+        return
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _lock:
+            _cpu["active"] = False
+            _cpu["tweets_profiled"] += 1
+            if not _cpu["armed"] and _cpu["profiler"] is profiler:
+                _dump_cpu_locked()
+
+
+def start_memory_capture(frames=10):
+    with _lock:
+        if tracemalloc.is_tracing():
+            return False
+        tracemalloc.start(frames)
+        _memory.update(started_at=time.time(), result_path=None)
+    print(f"🔬 tracemalloc started ({frames} frames)")
+    return True
+
+
+def stop_memory_capture(limit=50):
+    """Snapshot allocations, stop tracemalloc and write the top entries as text."""
+    with _lock:
+        if not tracemalloc.is_tracing():
+            return _memory["result_path"]
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        stats = snapshot.statistics("lineno")
+        path = _result_path("memory", "txt")
+        with open(path, "w") as f:
+            f.write(f"current={current} peak={peak} bytes\n")
+            for stat in stats[:limit]:
+                f.write(f"{stat}\n")
+        _memory["result_path"] = path
+    print(f"🔬 tracemalloc snapshot written to {path}")
+    return path
+
+
+def status():
+    with _lock:
+        return {
+            "cpu": {
+                "armed": _cpu["armed"],
+                "active": _cpu["active"],
+                "sample_rate": _cpu["sample_rate"],
+                "started_at": _cpu["started_at"],
+                "tweets_profiled": _cpu["tweets_profiled"],
+                "result_path": _cpu["result_path"],
+            },
+            "memory": {
+                "tracing": tracemalloc.is_tracing(),
+                "started_at": _memory["started_at"],
+                "result_path": _memory["result_path"],
+            },
+        }
+
+
+def cpu_result_path():
+    with _lock:
+        return _cpu["result_path"]
+
+
+def memory_result_path():
+    with _lock:
+        return _memory["result_path"]
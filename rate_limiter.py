@@ -0,0 +1,180 @@
+"""
+Sliding-window rate limiting for replies.
+
+Each key keeps two fixed-window counts: the current window and the one before
+it. The number of replies in the trailing window is estimated as the current
+count plus the previous count weighted by how much of the previous window
+still overlaps it, so at most about `limit` replies land in any `window`
+seconds while each check stays O(1) with constant state per key.
+
+A key whose last reply was two or more windows ago has both counts at zero,
+so dropping it never changes a decision. Beyond that, `max_keys` is a hard
+cap: when it is exceeded the least recently used key is dropped even if its
+counts are non-zero, which gives that key a full quota again (lossy).
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def format_window(seconds):
+    """Human-readable window length for log messages (e.g. 24h, 30m, 45s)."""
+    seconds = int(seconds)
+    if seconds % 86400 == 0:
+        days = seconds // 86400
+        return "24h" if days == 1 else f"{days}d"
+    if seconds % 3600 == 0:
+        return f"{seconds // 3600}h"
+    if seconds % 60 == 0:
+        return f"{seconds // 60}m"
+    return f"{seconds}s"
+
+
+class SlidingWindowLimiter:
+    """
+    Keyed sliding-window counters with O(1) checks and idle eviction.
+    A limit of 0 disables the limiter (every check passes, nothing is stored).
+    """
+
+    def __init__(self, limit, window_seconds, max_keys=10000, clock=time.time):
+        if limit > 0 and window_seconds <= 0:
+            raise ValueError(f"rate limit window must be > 0 seconds, got {window_seconds}")
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self.clock = clock
+        # key -> [window_index, current_count, previous_count]; oldest-touched first
+        self._counters = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.limit > 0
+
+    def __len__(self):
+        return len(self._counters)
+
+    def _window_index(self, now):
+        return int(now // self.window_seconds)
+
+    def _counts(self, key, index):
+        """(current, previous) counts for `key` as of window `index`."""
+        counter = self._counters.get(key)
+        if counter is None:
+            return 0, 0
+        counter_index, current, previous = counter
+        if counter_index == index:
+            return current, previous
+        if counter_index == index - 1:
+            return 0, current
+        return 0, 0
+
+    def _estimate(self, key, now):
+        index = self._window_index(now)
+        current, previous = self._counts(key, index)
+        elapsed = (now - index * self.window_seconds) / self.window_seconds
+        return current + previous * (1.0 - elapsed)
+
+    def _evict(self, now):
+        # Keys untouched for two windows count zero, so dropping them is lossless;
+        # dropping for the max_keys cap is lossy (the key gets a full quota back)
+        index = self._window_index(now)
+        while self._counters:
+            key, (counter_index, _, _) = next(iter(self._counters.items()))
+            if counter_index < index - 1 or len(self._counters) > self.max_keys:
+                self._counters.popitem(last=False)
+            else:
+                break
+
+    def allows(self, key):
+        """Return True if one more reply for `key` stays within the limit."""
+        if not self.enabled:
+            return True
+        with self._lock:
+            now = self.clock()
+            self._evict(now)
+            return self._estimate(key, now) + 1.0 <= self.limit
+
+    def consume(self, key):
+        """Count one reply for `key`."""
+        if not self.enabled:
+            return
+        with self._lock:
+            now = self.clock()
+            index = self._window_index(now)
+            current, previous = self._counts(key, index)
+            self._counters[key] = [index, current + 1, previous]
+            self._counters.move_to_end(key)
+            self._evict(now)
+
+    def to_state(self):
+        with self._lock:
+            return {key: list(counter) for key, counter in self._counters.items()}
+
+    def load_state(self, state):
+        if not self.enabled:
+            return
+        with self._lock:
+            now = self.clock()
+            entries = sorted(state.items(), key=lambda item: item[1][0])
+            self._counters = OrderedDict(
+                (key, [int(index), int(current), int(previous)])
+                for key, (index, current, previous) in entries
+            )
+            self._evict(now)
+
+
+class ReplyRateLimiter:
+    """Per-user and global reply limits, with optional JSON persistence."""
+
+    GLOBAL_KEY = "*"
+
+    def __init__(self, per_user_max, per_user_window, global_max, global_window,
+                 max_users=10000, state_file=None):
+        self.per_user = SlidingWindowLimiter(per_user_max, per_user_window, max_keys=max_users)
+        self.global_ = SlidingWindowLimiter(global_max, global_window, max_keys=1)
+        self.state_file = state_file or None
+
+    def check(self, username):
+        """Check if limits allow a reply. Returns (can_process, reason)."""
+        if not self.global_.allows(self.GLOBAL_KEY):
+            return False, f"global limit ({self.global_.limit}/{format_window(self.global_.window_seconds)}) reached"
+        if not self.per_user.allows(username.lower()):
+            return False, (
+                f"per-user limit ({self.per_user.limit}/{format_window(self.per_user.window_seconds)}) "
+                f"for @{username} reached"
+            )
+        return True, ""
+
+    def record(self, username):
+        """Count a successful reply against both limits."""
+        self.global_.consume(self.GLOBAL_KEY)
+        self.per_user.consume(username.lower())
+
+    def load(self):
+        if not self.state_file:
+            return
+        try:
+            with open(self.state_file, "r") as f:
+                state = json.load(f)
+            self.per_user.load_state(state.get("per_user", {}))
+            self.global_.load_state(state.get("global", {}))
+            print(f"📂 Loaded rate limit state for {len(self.per_user)} users from {self.state_file}")
+        except FileNotFoundError:
+            print(f"📂 No existing rate limit state file, starting fresh")
+        except Exception as e:
+            print(f"⚠️ Failed to load rate limit state: {e}")
+
+    def save(self):
+        if not self.state_file:
+            return
+        state = {"per_user": self.per_user.to_state(), "global": self.global_.to_state()}
+        tmp_path = f"{self.state_file}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_file)
+        except Exception as e:
+            print(f"⚠️ Failed to save rate limit state: {e}")
@@ -1,5 +1,17 @@
+import hmac
+import os
 import threading
-from fastapi import FastAPI
+from typing import Optional
+
+from dotenv import load_dotenv
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import FileResponse
+
+import profiling
+
+load_dotenv()
+
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
 
 # Start the polling bot in a background thread
 
@@ -18,5 +30,69 @@ def root():
 def healthz():
     return {"ok": True}
 
+# --- Admin: live profiling (disabled unless ADMIN_TOKEN is set)
+
+def _require_admin(token):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="admin endpoints disabled")
+    if not hmac.compare_digest((token or "").encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="invalid admin token")
+
+def _download(path, media_type):
+    if not path:
+        raise HTTPException(status_code=404, detail="no capture available")
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail="capture file no longer exists")
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+@app.get("/admin/profile")
+def profile_status(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return profiling.status()
+
+@app.post("/admin/profile/cpu/start")
+def cpu_start(sample_rate: float = 1.0, x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    if not 0.0 < sample_rate <= 1.0:
+        raise HTTPException(status_code=400, detail="sample_rate must be in (0, 1]")
+    if not profiling.start_cpu_capture(sample_rate):
+        raise HTTPException(status_code=409, detail="cpu capture already running or still finishing")
+    return profiling.status()["cpu"]
+
+@app.post("/admin/profile/cpu/stop")
+def cpu_stop(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    path = profiling.stop_cpu_capture()
+    return {"result_path": path, "pending": path is None}
+
+@app.get("/admin/profile/cpu")
+def cpu_download(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return _download(profiling.cpu_result_path(), "application/octet-stream")
+
+@app.post("/admin/profile/memory/start")
+def memory_start(frames: int = 10, x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    if frames < 1:
+        raise HTTPException(status_code=400, detail="frames must be >= 1")
+    if not profiling.start_memory_capture(frames):
+        raise HTTPException(status_code=409, detail="tracemalloc already running")
+    return profiling.status()["memory"]
+
+@app.post("/admin/profile/memory/stop")
+def memory_stop(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return {"result_path": profiling.stop_memory_capture()}
+
+@app.get("/admin/profile/memory")
+def memory_download(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return _download(profiling.memory_result_path(), "text/plain")
+
+@app.get("/admin/traces")
+def traces_download(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return _download(os.getenv("TRACE_FILE", "traces.jsonl"), "application/x-ndjson")
+
 # Launch the bot loop once at startup
-threading.Thread(target=_start_bot, daemon=True).start()
\ No newline at end of file
+threading.Thread(target=_start_bot, daemon=True).start()
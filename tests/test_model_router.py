@@ -0,0 +1,216 @@
+"""ModelRouter against a local fake provider (latencies scaled down to milliseconds)."""
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_router import Backend, ModelRouter, parse_backends  # noqa: E402
+
+
+class FakeHandle:
+    def __init__(self, latency, fail):
+        self.done_at = time.monotonic() + latency
+        self.fail = fail
+        self.cancelled = False
+
+    def poll(self):
+        if self.cancelled:
+            return True, None, RuntimeError("canceled")
+        if time.monotonic() < self.done_at:
+            return False, None, None
+        if self.fail:
+            return True, None, RuntimeError("prediction failed")
+        return True, "https://example.invalid/out.png", None
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeProvider:
+    """
+    Each ref maps to (base_latency, tail_probability, tail_latency_range,
+    error_probability, start_error_probability).
+    """
+
+    def __init__(self, profiles, seed=1):
+        self.profiles = profiles
+        self.rng = random.Random(seed)
+        self.started = 0
+        self.start_attempts = 0
+
+    def start(self, ref, input):
+        self.start_attempts += 1
+        base, tail_p, tail_range, err_p, start_err_p = self.profiles[ref]
+        if self.rng.random() < start_err_p:
+            raise RuntimeError(f"422 invalid version for {ref}")
+        self.started += 1
+        latency = base * self.rng.uniform(0.8, 1.2)
+        if self.rng.random() < tail_p:
+            latency = self.rng.uniform(*tail_range)
+        return FakeHandle(latency, self.rng.random() < err_p)
+
+
+TAIL_PROFILES = {
+    "a": (0.010, 0.04, (0.10, 0.15), 0.0, 0.0),
+    "b": (0.015, 0.03, (0.10, 0.15), 0.0, 0.0),
+}
+
+
+def _run_many(router, n, workers=16):
+    def one(_):
+        t0 = time.monotonic()
+        router.run({})
+        return time.monotonic() - t0
+
+    with ThreadPoolExecutor(workers) as ex:
+        return sorted(ex.map(one, range(n)))
+
+
+def _p99(latencies):
+    return latencies[int(0.99 * len(latencies))]
+
+
+def _router(provider, **kwargs):
+    kwargs.setdefault("poll_interval", 0.001)
+    kwargs.setdefault("timeout", 5)
+    return ModelRouter([Backend("a", 2), Backend("b", 1)], provider, **kwargs)
+
+
+def test_hedging_improves_p99_within_budget(capsys):
+    random.seed(1)
+    baseline = _run_many(_router(FakeProvider(TAIL_PROFILES), hedge_enable=False), 1500)
+
+    random.seed(1)
+    provider = FakeProvider(TAIL_PROFILES)
+    router = _router(provider, hedge_max_ratio=0.1)
+    hedged = _run_many(router, 1500)
+
+    assert _p99(hedged) < 0.6 * _p99(baseline)
+    assert router.hedges <= router.hedge_max_ratio * router.runs
+    # Every extra start is a hedge (no failures in this profile)
+    assert provider.started - router.runs == router.hedges
+
+
+def test_start_failure_is_recorded_and_retried(capsys):
+    random.seed(2)
+    profiles = {
+        "good": (0.002, 0.0, (0, 0), 0.0, 0.0),
+        "bad": (0.002, 0.0, (0, 0), 0.0, 1.0),
+    }
+    provider = FakeProvider(profiles)
+    good, bad = Backend("good"), Backend("bad")
+    router = ModelRouter([good, bad], provider, poll_interval=0.001, timeout=5)
+
+    results = [router.run({}) for _ in range(200)]
+
+    assert all(info["backend"] == "good" for _, info in results)
+    assert bad.error_rate > 0.5
+    # Once its errors are known, "bad" only gets the small exploration share
+    bad_attempts = provider.start_attempts - provider.started
+    assert bad_attempts < 40
+    # Each failed start is followed by exactly one retry on "good"
+    assert router.retries == bad_attempts
+
+
+def test_all_backends_failing_raises(capsys):
+    profiles = {
+        "a": (0.001, 0.0, (0, 0), 1.0, 0.0),
+        "b": (0.001, 0.0, (0, 0), 0.0, 1.0),
+    }
+    router = _router(FakeProvider(profiles))
+
+    with pytest.raises(RuntimeError, match="All model backends failed"):
+        router.run({})
+    assert all(b.error_rate > 0 for b in router.backends)
+
+
+def test_run_reports_backend_and_flags(capsys):
+    profiles = {"a": (0.001, 0.0, (0, 0), 1.0, 0.0), "b": (0.001, 0.0, (0, 0), 0.0, 0.0)}
+    a, b = Backend("a"), Backend("b")
+    router = ModelRouter([a, b], FakeProvider(profiles), poll_interval=0.001)
+    router.pick = lambda exclude=None: b if exclude else a
+
+    output, info = router.run({})
+
+    assert output
+    assert info == {"backend": "b", "hedged": False, "retried": True}
+
+
+@pytest.mark.parametrize("spec", ["foo=0", "foo=-1", "a=1,b=0", "foo=abc"])
+def test_parse_backends_rejects_invalid_weights(spec):
+    with pytest.raises(ValueError, match="MODEL_BACKENDS"):
+        parse_backends(spec, "default/model")
+
+
+def test_parse_backends_defaults():
+    assert [(b.ref, b.weight) for b in parse_backends("", "google/nano-banana")] == [("google/nano-banana", 1.0)]
+    assert [(b.ref, b.weight) for b in parse_backends("x/y=3, x/z:v", "d")] == [("x/y", 3.0), ("x/z:v", 1.0)]
+
+
+class FlakyPollHandle(FakeHandle):
+    """Status checks raise for the first `poll_failures` polls."""
+
+    def __init__(self, latency, poll_failures):
+        super().__init__(latency, False)
+        self.poll_failures = poll_failures
+
+    def poll(self):
+        if self.poll_failures:
+            self.poll_failures -= 1
+            raise ConnectionError("status check timed out")
+        return super().poll()
+
+
+class FlakyPollProvider:
+    def __init__(self, poll_failures):
+        self.poll_failures = poll_failures
+        self.handles = []
+
+    def start(self, ref, input):
+        handle = FlakyPollHandle(0.002, self.poll_failures.get(ref, 0))
+        self.handles.append(handle)
+        return handle
+
+
+def test_transient_poll_error_keeps_prediction(capsys):
+    provider = FlakyPollProvider({"a": 2, "b": 2})
+    router = _router(provider)
+
+    output, info = router.run({})
+
+    assert output
+    assert len(provider.handles) == 1
+    assert not provider.handles[0].cancelled
+    assert info["retried"] is False
+    assert all(b.error_rate == 0 for b in router.backends)
+
+
+def test_repeated_poll_errors_cancel_before_retry(capsys):
+    a, b = Backend("a"), Backend("b")
+    provider = FlakyPollProvider({"a": 1000})
+    router = ModelRouter([a, b], provider, poll_interval=0.001, max_poll_errors=3)
+    router.pick = lambda exclude=None: b if exclude else a
+
+    output, info = router.run({})
+
+    assert output
+    assert info == {"backend": "b", "hedged": False, "retried": True}
+    assert provider.handles[0].cancelled
+    assert a.error_rate == 0
+
+
+def test_single_backend_never_hedges(capsys):
+    provider = FakeProvider({"a": TAIL_PROFILES["a"]})
+    router = ModelRouter([Backend("a")], provider, hedge_min_samples=5,
+                         hedge_max_ratio=1.0, poll_interval=0.001, timeout=5)
+
+    _run_many(router, 200)
+
+    assert router.hedge_enable is False
+    assert router.hedges == 0
+    assert provider.started == router.runs
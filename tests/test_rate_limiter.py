@@ -0,0 +1,73 @@
+"""Sliding-window rate limiting with a controllable clock."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rate_limiter import ReplyRateLimiter, SlidingWindowLimiter  # noqa: E402
+
+
+class Clock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _allowed_at(limiter, key, times, clock):
+    allowed = []
+    for t in times:
+        clock.now = t
+        if limiter.allows(key):
+            limiter.consume(key)
+            allowed.append(t)
+    return allowed
+
+
+def test_no_trailing_window_exceeds_limit():
+    clock = Clock()
+    limiter = SlidingWindowLimiter(3, 100, clock=clock)
+    allowed = _allowed_at(limiter, "a", [i * 0.5 for i in range(2000)], clock)
+
+    assert len(allowed) > 3
+    for start in allowed:
+        assert sum(1 for t in allowed if start <= t < start + 100) <= 3
+
+
+def test_idle_keys_are_evicted_and_cap_is_enforced():
+    clock = Clock()
+    limiter = SlidingWindowLimiter(1, 10, max_keys=3, clock=clock)
+    for key in "abcde":
+        limiter.consume(key)
+    assert len(limiter) == 3
+
+    clock.now = 25
+    limiter.allows("z")
+    assert len(limiter) == 0
+
+
+@pytest.mark.parametrize("window", [0, -5])
+def test_non_positive_window_is_rejected(window):
+    with pytest.raises(ValueError):
+        SlidingWindowLimiter(3, window)
+
+
+def test_disabled_limit_allows_everything():
+    limiter = SlidingWindowLimiter(0, 0)
+    limiter.consume("a")
+    assert limiter.allows("a") and len(limiter) == 0
+
+
+def test_state_round_trip(tmp_path, capsys):
+    path = str(tmp_path / "limits.json")
+    limiter = ReplyRateLimiter(1, 3600, 5, 3600, state_file=path)
+    limiter.record("Bob")
+    limiter.save()
+
+    restored = ReplyRateLimiter(1, 3600, 5, 3600, state_file=path)
+    restored.load()
+    assert restored.check("bob")[0] is False
+    assert restored.check("alice")[0] is True
@@ -0,0 +1,129 @@
+"""
+Per-tweet trace records.
+
+process_tweet opens a trace for each tweet and the helpers it calls wrap their
+work in span(...). When the tweet finishes, one JSON line with the span
+timings is handed to a QueueHandler; a QueueListener thread does the actual
+write to a rotating file, so the bot loop never blocks on disk I/O.
+"""
+import json
+import logging
+import logging.handlers
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+_logger = logging.getLogger("pfp_bot.trace")
+_logger.propagate = False
+_listener = None
+_local = threading.local()
+
+
+def setup_trace_logging(path, max_bytes, backup_count):
+    """Start the background writer. Safe to call more than once."""
+    global _listener
+    if _listener is not None:
+        return
+    file_handler = logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8"
+    )
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+    log_queue = queue.SimpleQueue()
+    _logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _logger.setLevel(logging.INFO)
+    _listener = logging.handlers.QueueListener(log_queue, file_handler)
+    _listener.start()
+    print(f"🧵 Writing per-tweet traces to {path}")
+
+
+def shutdown_trace_logging():
+    """Flush pending records and stop the background writer."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+class TweetTrace:
+    """Span timings and attributes collected while processing one tweet."""
+
+    def __init__(self, tweet_id):
+        self.tweet_id = str(tweet_id)
+        self.started_at = datetime.now(timezone.utc)
+        self.t0 = time.perf_counter()
+        self.spans = []
+        self.attrs = {}
+        self.outcome = None
+
+    def add_span(self, name, start, end, error=None, **attrs):
+        entry = {
+            "name": name,
+            "start_ms": round((start - self.t0) * 1000, 1),
+            "duration_ms": round((end - start) * 1000, 1),
+        }
+        if error:
+            entry["error"] = error
+        if attrs:
+            entry.update(attrs)
+        self.spans.append(entry)
+
+    def to_record(self):
+        return {
+            "tweet_id": self.tweet_id,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round((time.perf_counter() - self.t0) * 1000, 1),
+            "outcome": self.outcome,
+            "attrs": self.attrs,
+            "spans": self.spans,
+        }
+
+
+def current_trace():
+    return getattr(_local, "trace", None)
+
+
+@contextmanager
+def tweet_trace(tweet_id):
+    """Collect spans for one tweet and emit a single JSONL record when done."""
+    trace = TweetTrace(tweet_id)
+    previous = current_trace()
+    _local.trace = trace
+    try:
+        yield trace
+    except Exception as e:
+        trace.outcome = trace.outcome or "error"
+        trace.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _local.trace = previous
+        if _listener is not None:
+            _logger.info(json.dumps(trace.to_record(), default=str))
+
+
+@contextmanager
+def span(name, **attrs):
+    """
+    Time a block against the current tweet trace (no-op outside a trace).
+    Yields the span's attrs dict so the block can add results to it.
+    """
+    trace = current_trace()
+    if trace is None:
+        yield dict(attrs)
+        return
+    start = time.perf_counter()
+    try:
+        yield attrs
+    except Exception as e:
+        trace.add_span(name, start, time.perf_counter(), error=f"{type(e).__name__}: {e}", **attrs)
+        raise
+    trace.add_span(name, start, time.perf_counter(), **attrs)
+
+
+def set_outcome(outcome, **attrs):
+    """Record how the current tweet ended (replied, skipped:<reason>, ...)."""
+    trace = current_trace()
+    if trace is not None:
+        trace.outcome = outcome
+        trace.attrs.update(attrs)